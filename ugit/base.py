@@ -1,7 +1,8 @@
 import os  # File and directory handling
-import itertools  # Useful tools for iterating, like takewhile
-import operator  # Functional equivalents of Python operators (e.g., truth)
+import functools  # lru_cache for parsed commits and trees
+import operator  # Functional equivalents of Python operators (e.g., itemgetter)
 from collections import deque, namedtuple  # Lightweight class for storing commit data
+from concurrent.futures import ThreadPoolExecutor  # Hash files in parallel in add()
 from . import data  # Custom module for low-level object database (blobs, trees, commits)
 from . import diff
 import string
@@ -12,95 +13,107 @@ def init():
 
 
 def write_tree():
-    # Convert flat index (filename → oid) into a nested tree-like structure
-    index_as_tree = {}
-
     with data.get_index() as index:
-        for path, oid in index.items():
-            # Split file path into directories and filename
-            path = path.split('/')
-            dirpath, filename = path[:-1], path[-1]
-
-            current = index_as_tree
-            # Traverse or create intermediate directories
-            for dirname in dirpath:
-                current = current.setdefault(dirname, {})  # Create sub-dict if missing
-            
-            # Assign file (blob) oid at the correct location
-            current[filename] = oid
+        paths = sorted(index.items())
+
+    # Sorted paths keep every directory's contents contiguous, so one pass
+    # with a stack of open directories writes each subtree as soon as the
+    # walk leaves it. Each stack item is (dir path ending in '/', entries).
+    stack = [('', [])]
+
+    def close_directory():
+        dir_path, entries = stack.pop()
+        parent_path, parent_entries = stack[-1]
+        name = dir_path[len(parent_path):-1]
+        parent_entries.append((name, _write_tree_entries(entries), 'tree'))
+
+    for path, oid in paths:
+        dirname, _, filename = path.rpartition('/')
+        dir_path = f'{dirname}/' if dirname else ''
 
-    # Recursively write tree objects for each directory
-    def write_tree_recursive(tree_dict):
-        entries = []
+        # Close directories this path is not in
+        while not dir_path.startswith(stack[-1][0]):
+            close_directory()
 
-        for name, value in tree_dict.items():
-            if type(value) is dict:
-                # It's a directory → write subtree
-                type_ = 'tree'
-                oid = write_tree_recursive(value)
-            else:
-                # It's a file → use blob oid
-                type_ = 'blob'
-                oid = value
+        # Open the directories between the innermost open one and this path
+        while stack[-1][0] != dir_path:
+            open_path = stack[-1][0]
+            name = dir_path[len(open_path):].split('/', 1)[0]
+            stack.append((f'{open_path}{name}/', []))
 
-            entries.append((name, oid, type_))
+        stack[-1][1].append((filename, oid, 'blob'))
 
-        # Format entries and write to object database as a 'tree'
-        tree = ''.join(
-            f'{type_} {oid} {name}\n'
-            for name, oid, type_ in sorted(entries)
-        )
+    while len(stack) > 1:
+        close_directory()
 
-        return data.hash_object(tree.encode(), 'tree')
+    return _write_tree_entries(stack[0][1])
 
-    # Start writing from the root of the index tree
-    return write_tree_recursive(index_as_tree)
 
+# Format (name, oid, type) entries straight into bytes and write them to the
+# object database as a 'tree'
+def _write_tree_entries(entries):
+    tree = bytearray()
+    for name, oid, type_ in sorted(entries, key=operator.itemgetter(0)):
+        tree += type_.encode()
+        tree += b' '
+        tree += oid.encode()
+        tree += b' '
+        tree += os.fsencode(name)
+        tree += b'\n'
 
-# Generator that yields each entry from a tree object
+    return data.hash_object(tree, 'tree')
+
+
+# Returns the (type, oid, name) entries of a tree object as a tuple.
+# Trees are immutable by oid, so parsed entries are memoized.
+@functools.lru_cache(maxsize=8192)
 def _iter_tree_entries(oid):
     if not oid:
-        return  # Return nothing if OID is invalid
+        return ()  # Nothing to list if OID is invalid
 
     tree = data.get_object(oid, 'tree')  # Read tree object from the database
-    for entry in tree.decode().splitlines():  # Split into lines like: "blob <oid> <name>"
-        type_, oid, name = entry.split(' ', 2)
-        yield type_, oid, name
-
-# Returns a dictionary of all blobs under a tree: {path: oid}
+    # Split on '\n' only: splitlines() would also break names containing
+    # '\r' or other line separators, and is slower
+    return tuple(
+        tuple(entry.split(' ', 2))  # Lines look like: "blob <oid> <name>"
+        for entry in os.fsdecode(tree).split('\n') if entry  # As _write_tree_entries encodes
+    )
+
+# Returns a dictionary of all blobs under a tree: {path: oid}.
+# Walks nested trees with an explicit stack of (entries iterator, path prefix)
+# so all blobs go into one dict, in the same order a recursive walk gives.
 def get_tree(oid, base_path=''):
-    # print(f'get_tree called with oid: {oid}')
     results = {}
+    stack = [(iter(_iter_tree_entries(oid)), base_path)]
 
-    for type_, oid2, name in _iter_tree_entries(oid):
-        # print(f'tree entry: {type_}, {oid2}, {name}')
+    while stack:
+        entries, prefix = stack[-1]
+        entry = next(entries, None)
+        if entry is None:
+            stack.pop()  # Finished this tree
+            continue
+
+        type_, oid2, name = entry
         assert '/' not in name  # Names should not contain slashes
         assert name not in ('..', '.')  # Skip special directories
 
-        path = base_path + name  # Build relative path from root
+        path = prefix + name  # Build relative path from root
 
         if type_ == 'blob':
             results[path] = oid2  # Record the file and its oid
         elif type_ == 'tree':
-            results.update(get_tree(oid2, f'{path}/'))  # Recurse for nested tree
+            stack.append((iter(_iter_tree_entries(oid2)), f'{path}/'))  # Descend into nested tree
         else:
             assert False, f'Unknown tree entry {type_}'  # Should never happen
 
-    # print(f'get_tree results: {results}')
     return results
 
 def get_working_tree():
     
     result = {}
     
-    for root, _, filenames in os.walk('.'):
-        for filename in filenames:
-            path = os.path.relpath(f'{root}/{filename}')
-        
-        if is_ignored(path) and not os.path.isfile(path):
-            continue
-        with open(path, 'rb') as f:
-            result[path] = data.hash_object(f.read())
+    for path, _ in _iter_files('.'):
+        result[os.path.relpath(path)] = data.hash_file(path)
             
     return result
 
@@ -113,21 +126,15 @@ def get_index_tree ():
 
 # Deletes everything in the current directory except .ugit
 def _empty_current_directory():
-    for root, dirnames, filenames in os.walk('.', topdown=False):  # Bottom-up traversal
-        for filename in filenames:
-            path = os.path.relpath(f'{root}/{filename}')  # Relative path for consistency
-            if is_ignored(path) or not os.path.isfile(path):
-                continue
+    for entry in _iter_entries_bottom_up('.'):  # Children before their directory
+        path = os.path.relpath(entry.path)  # Relative path for consistency
+        if not entry.is_dir(follow_symlinks=False):
             os.remove(path)
-
-        for dirname in dirnames:
-            path = os.path.relpath(f'{root}/{dirname}')
-            if is_ignored(path):
-                continue
-            try:
-                os.rmdir(path)  # Only removes empty dirs
-            except (FileNotFoundError, OSError):
-                pass  # Directory might not be empty
+            continue
+        try:
+            os.rmdir(path)  # Only removes empty dirs
+        except (FileNotFoundError, OSError):
+            pass  # Directory might not be empty
 
 
 def read_tree (tree_oid, update_working=False):
@@ -244,17 +251,56 @@ def merge (other):
     read_tree_merged (c_HEAD.tree, c_base.tree,c_other.tree)
     print ('Merged in working tree\nPlease commit')
 
-def get_merge_base(oid1, oid2):
-    parents1 = set(iter_commits_and_parents({oid1}))
-    
-    for oid in iter_commits_and_parents({oid2}):
-        
-        if oid in parents1:
-            return oid
-        
+# Flags painted on commits while looking for a merge base
+_PARENT1, _PARENT2, _STALE, _RESULT = 1, 2, 4, 8
+
 
+# Walks both histories together, breadth first, painting each commit with the
+# side(s) it was reached from. A commit painted by both sides is a common
+# ancestor; its own ancestors are painted stale since they can't be better.
+# The walk stops as soon as only stale commits are left to visit, so it only
+# goes as deep as the merge base instead of the whole history.
+def get_merge_base(oid1, oid2):
+    if oid1 == oid2:
+        return oid1
+
+    flags = {oid1: _PARENT1, oid2: _PARENT2}
+    queue = deque([(oid1, True), (oid2, True)])  # (oid, counted as non-stale)
+    non_stale = 2
+    results = []
+
+    while non_stale:
+        oid, counted = queue.popleft()
+        non_stale -= counted
+
+        oid_flags = flags[oid] & ~_RESULT
+        if oid_flags == _PARENT1 | _PARENT2:
+            if not flags[oid] & _RESULT:
+                flags[oid] |= _RESULT
+                results.append(oid)
+            oid_flags |= _STALE
+
+        for parent in get_commit(oid).parents:
+            parent_flags = flags.get(parent, 0)
+            if parent_flags | oid_flags != parent_flags:
+                flags[parent] = parent_flags | oid_flags
+                is_stale = bool(oid_flags & _STALE)
+                queue.append((parent, not is_stale))
+                non_stale += not is_stale
+
+    results = [oid for oid in results if not flags[oid] & _STALE]
+    if len(results) > 1:
+        # Stale paint may not have reached every redundant result yet
+        redundant = set(iter_commits_and_parents(
+            parent for oid in results for parent in get_commit(oid).parents))
+        results = [oid for oid in results if oid not in redundant]
+
+    return results[0] if results else None
+
+
+# Stops walking as soon as maybe_ancestor comes up
 def is_ancestor_of(commit, maybe_ancestor):
-    return maybe_ancestor in iter_commits_and_parents(commit)
+    return maybe_ancestor in iter_commits_and_parents({commit})
 
 # Placeholder for tagging functionality (not yet implemented)
 def create_tag(name, oid):
@@ -289,27 +335,35 @@ Commit = namedtuple('Commit', ['tree', 'parents', 'message'])
 
 
 
-# Parse a commit object into tree, parent, and message
+# Parse a commit object into tree, parent, and message.
+# Commits are immutable by oid, so history walks reuse the parsed result;
+# callers must not mutate the returned parents list.
+@functools.lru_cache(maxsize=8192)
 def get_commit(oid):
     parents = []  # Default parent
-    # tree = None  # Default tree
-
-    commit = data.get_object(oid, 'commit').decode()  # Load and decode commit
-    lines = iter(commit.splitlines())  # Make iterable for line-by-line reading
-
-    for line in itertools.takewhile(operator.truth, lines):  # Read until first blank line
-        key, val = line.split(' ', 1)
-        if key == 'tree':
-            tree = val
-        elif key == 'parent':
-            parents.append(val)
+    tree = None  # Default tree
+
+    # The header is ASCII and small: parse it as bytes and decode only the values
+    commit = data.get_object(oid, 'commit')  # Load commit
+    header, _, message = commit.partition(b'\n\n')  # Header ends at first blank line
+
+    for line in header.split(b'\n'):
+        key, _, val = line.partition(b' ')
+        if key == b'tree':
+            tree = val.decode()
+        elif key == b'parent':
+            parents.append(val.decode())
         else:
-            assert False, f'Unkown field {key}'  # Error for unexpected fields
+            assert False, f'Unkown field {key.decode()}'  # Error for unexpected fields
 
-    message = '\n'.join(lines)  # Remaining lines are the commit message
-    return Commit(tree=tree, parents=parents, message=message)  # Return structured result
+    if message.endswith(b'\n'):
+        message = message[:-1]  # Drop the newline commit() writes after the message
+    return Commit(tree=tree, parents=parents, message=message.decode())  # Return structured result
 
-def iter_commits_and_parents(oids):
+# Yields the given commits and all their ancestors, each once. Commits in
+# stop_at (e.g. ones the other side already has) are neither yielded nor
+# expanded, so only the history in between is walked.
+def iter_commits_and_parents(oids, *, stop_at=frozenset()):
     
     oids = deque(oids)
     visited = set()
@@ -318,8 +372,9 @@ def iter_commits_and_parents(oids):
         
         oid = oids.popleft()
         
-        if not oid or oid in visited:
+        if not oid or oid in visited or oid in stop_at:
             continue
+        visited.add(oid)
         
         yield oid
         
@@ -327,7 +382,7 @@ def iter_commits_and_parents(oids):
         oids.extendleft(commit.parents[:1])
         oids.extend(commit.parents[1:])
 
-def iter_objects_in_commits (oids):
+def iter_objects_in_commits (oids, *, stop_at=frozenset()):
     # N.B. Must yield the oid before acccessing it (to allow caller to fetch it
     # if needed)
 
@@ -343,7 +398,7 @@ def iter_objects_in_commits (oids):
                     visited.add (oid)
                     yield oid
 
-    for oid in iter_commits_and_parents (oids):
+    for oid in iter_commits_and_parents (oids, stop_at=stop_at):
         yield oid
         commit = get_commit (oid)
         if commit.tree not in visited:
@@ -370,9 +425,10 @@ def get_oid(name):
     
     for ref in refs_to_try:
         
-        # redudant to make two calls of function
-        if data.get_ref(ref, deref=False).value:
-            return data.get_ref(ref).value
+        ref_value = data.get_ref(ref, deref=False)
+        if ref_value.value:
+            # Only symbolic refs need a second lookup to resolve them
+            return data.get_ref(ref).value if ref_value.symbolic else ref_value.value
         
             
     
@@ -386,37 +442,61 @@ def get_oid(name):
     
 def add (filenames):
 
+    paths = []
+
     def add_file (filename):
         # Normalize path
-        
-        filename = os.path.relpath (filename)
-        with open (filename, 'rb') as f:
-            oid = data.hash_object (f.read ())
-        
-        index[filename] = oid
+        paths.append (os.path.relpath (filename))
 
     def add_directory (dirname):
-        for root, _, filenames in os.walk (dirname):
-            
-            for filename in filenames:
-                # Normalize path
-               
-                path = os.path.relpath (f'{root}/{filename}')
-                if is_ignored (path) or not os.path.isfile (path):
-                    continue
-                
-                add_file (path)
+        for path, _ in _iter_files (dirname):
+            add_file (path)
 
-    with data.get_index () as index:
-        for name in filenames:
-            
-            if os.path.isfile (name):
-                add_file (name)
-            
-            elif os.path.isdir (name):
-                add_directory (name)
-
-# Returns True if the path is inside .ugit (ignored from version control)
+    for name in filenames:
+        
+        if os.path.isfile (name):
+            add_file (name)
+        
+        elif os.path.isdir (name):
+            add_directory (name)
+
+    # Reading and hashing release the GIL, so files are hashed concurrently.
+    # Bulk adds append new objects to a single pack instead of one file each.
+    with data.get_index () as index, data.begin_pack (len (paths)), \
+         ThreadPoolExecutor () as executor:
+        for path, oid in zip (paths, executor.map (data.hash_file, paths)):
+            index[path] = oid
+
+# Yields (path, DirEntry) for every regular file under root, never descending into .ugit.
+# DirEntry caches the file type from readdir, so no extra stat per path.
+def _iter_files(root):
+    for entry in os.scandir(root):
+        if entry.name == '.ugit':
+            continue
+        if entry.is_dir(follow_symlinks=False):
+            yield from _iter_files(entry.path)
+        elif entry.is_file(follow_symlinks=False):
+            yield entry.path, entry
+
+# Like _iter_files, but yields DirEntry objects for files and directories,
+# each directory after its contents (so it can be removed once emptied)
+def _iter_entries_bottom_up(root):
+    for entry in os.scandir(root):
+        if entry.name == '.ugit':
+            continue
+        if entry.is_dir(follow_symlinks=False):
+            yield from _iter_entries_bottom_up(entry.path)
+            yield entry
+        elif entry.is_file(follow_symlinks=False):
+            yield entry
+
+# Returns True if the path is inside .ugit (ignored from version control).
+# Checks for a '.ugit' path component with string tests instead of building
+# a list with split(). The directory walks above already skip .ugit, so they
+# don't need to call this.
 def is_ignored(path):
-    return '.ugit' in path.split('/')
+    if os.sep != '/':
+        path = path.replace(os.sep, '/')
+    return (path == '.ugit' or path.startswith('.ugit/')
+            or path.endswith('/.ugit') or '/.ugit/' in path)
 
@@ -12,6 +12,7 @@ from . import remote
 def main():
 
     with data.change_git_dir('.'):
+        data.migrate_objects()
         args = parse_args()
         args.func(args)
         
@@ -116,8 +117,7 @@ def init(args):
     print(f'Initialized empty ugit repository in {os.getcwd()}/{data.GIT_DIR}')
 
 def hash_object(args):
-    with open (args.file, 'rb') as f:
-        print(data.hash_object(f.read()))
+    print(data.hash_file(args.file))
     
     
 def cat_file(args):
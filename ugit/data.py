@@ -1,14 +1,29 @@
 import json
 import os  # For file and directory manipulation
+import posixpath
 import hashlib  # For hashing file contents into SHA-1 hashes
+import itertools
 from collections import namedtuple
 from contextlib import contextmanager
 import shutil
-from typing import Iterator, Optional, Tuple, Union
+import struct
+import threading
+import zlib
+from typing import BinaryIO, Callable, Dict, Iterator, List, Optional, Sequence, Set, Tuple, Union
 
 # Define the directory that holds all Git-like internal data
 GIT_DIR: Optional[str] = None  # Hidden folder where all version control data is stored
 
+# zlib level for loose objects; 1 trades a little size for much faster writes
+COMPRESSION_LEVEL = 1
+
+# Number of decompressed objects kept in memory by get_object
+OBJECT_CACHE_SIZE = 4096
+OBJECT_CACHE_MAX_SIZE = 64 * 1024  # Bigger objects are always read from disk
+
+# Read size used by hash_file
+HASH_CHUNK_SIZE = 1 << 20
+
 RefValue = namedtuple('RefValue', ['symbolic', 'value'])
 
 
@@ -25,6 +40,7 @@ def change_git_dir(new_dir: str):
 def init() -> None:
     os.makedirs(GIT_DIR)  # type: ignore
     os.makedirs(f'{GIT_DIR}/objects')  # type: ignore
+    open(f'{GIT_DIR}/objects/{OBJECTS_SHARDED_MARKER}', 'w').close()
 
 
 def update_ref(ref: str, value: RefValue, deref: bool = True) -> None:
@@ -38,6 +54,8 @@ def update_ref(ref: str, value: RefValue, deref: bool = True) -> None:
     with open(ref_path, 'w') as f:
         f.write(content)
 
+    _ref_cache.pop(GIT_DIR, None)  # type: ignore
+
 
 def get_ref(ref: str, deref: bool = True) -> RefValue:
     return _get_ref_internal(ref, deref)[1]
@@ -46,33 +64,26 @@ def get_ref(ref: str, deref: bool = True) -> RefValue:
 def delete_ref(ref: str, deref: bool = True) -> None:
     refname = _get_ref_internal(ref, deref)[0]
     os.remove(f'{GIT_DIR}/{refname}')
+    _ref_cache.pop(GIT_DIR, None)  # type: ignore
 
 
 def _get_ref_internal(ref: str, deref: bool) -> Tuple[str, RefValue]:
-    ref_path = f'{GIT_DIR}/{ref}'
-    value: Optional[str] = None
-
-    if os.path.isfile(ref_path):
-        with open(ref_path) as f:
-            value = f.read().strip()
+    # The snapshot is keyed by normalized names, while callers may pass
+    # names like 'refs/remote//master' that still name the same file
+    ref = posixpath.normpath(ref)
+    value = _load_refs().get(ref)
 
     symbolic = bool(value) and value.startswith('ref:')
     if symbolic:
-        inner_ref = value.split(':', 1)[1].strip()
+        value = value.split(':', 1)[1].strip()
         if deref:
-            return _get_ref_internal(inner_ref, deref=True)
+            return _get_ref_internal(value, deref=True)
 
     return ref, RefValue(symbolic=symbolic, value=value)
 
 
 def iter_refs(prefix: str = '', deref: bool = True) -> Iterator[Tuple[str, RefValue]]:
-    refs = ['HEAD', 'MERGE_HEAD']
-
-    for root, _, filenames in os.walk(f'{GIT_DIR}/refs/'):
-        root = os.path.relpath(root, GIT_DIR)
-        refs.extend(f'{root}/{name}' for name in filenames)
-
-    for refname in refs:
+    for refname in list(_load_refs()):
         if not refname.startswith(prefix):
             continue
 
@@ -80,34 +91,213 @@ def iter_refs(prefix: str = '', deref: bool = True) -> Iterator[Tuple[str, RefVa
         if ref.value:
             yield refname, ref
 
+
+# Contents of every ref, per GIT_DIR, read in one pass on first use so lookups
+# don't go to disk. update_ref and delete_ref drop the snapshot.
+_ref_cache: Dict[str, Dict[str, str]] = {}
+
+
+def _load_refs() -> Dict[str, str]:
+    refs = _ref_cache.get(GIT_DIR)  # type: ignore
+    if refs is None:
+        refs = {}
+        for refname in itertools.chain(('HEAD', 'MERGE_HEAD'), _iter_ref_names('refs')):
+            try:
+                with open(f'{GIT_DIR}/{refname}') as f:
+                    refs[refname] = f.read().strip()
+            except FileNotFoundError:
+                pass
+        _ref_cache[GIT_DIR] = refs  # type: ignore
+
+    return refs
+
+
+def _iter_ref_names(root: str) -> Iterator[str]:
+    try:
+        entries = list(os.scandir(f'{GIT_DIR}/{root}'))
+    except FileNotFoundError:
+        return
+
+    for entry in entries:
+        refname = f'{root}/{entry.name}'
+        if entry.is_dir():
+            yield from _iter_ref_names(refname)
+        elif entry.is_file():
+            yield refname
+
 @contextmanager
 def get_index ():
     index = {}
     if os.path.isfile (f'{GIT_DIR}/index'):
-        with open (f'{GIT_DIR}/index') as f:
-            index = json.load (f)
+        with open (f'{GIT_DIR}/index', 'rb') as f:
+            index = _read_index (f.read ())
 
     yield index
 
-    with open (f'{GIT_DIR}/index', 'w') as f:
-        json.dump (index, f)
+    with open (f'{GIT_DIR}/index', 'wb') as f:
+        f.write (_write_index (index))
+
+
+# On-disk index: INDEX_MAGIC, then per entry a <I path length, the path
+# bytes and the 20 raw oid bytes. Oids are hex strings everywhere else.
+INDEX_MAGIC = b'UGIX'
+_INDEX_PATH_LEN = struct.Struct('<I')
+_OID_SIZE = 20
+
+
+def _read_index(raw: bytes) -> Dict[str, str]:
+    if not raw.startswith(INDEX_MAGIC):
+        # Older repositories still have a JSON index; it is rewritten in
+        # the binary format on the next save
+        return json.loads(raw) if raw else {}
+
+    index = {}
+    buf = memoryview(raw)
+    offset = len(INDEX_MAGIC)
+    while offset < len(buf):
+        (path_len,) = _INDEX_PATH_LEN.unpack_from(buf, offset)
+        offset += _INDEX_PATH_LEN.size
+        path = os.fsdecode(bytes(buf[offset:offset + path_len]))
+        offset += path_len
+        index[path] = buf[offset:offset + _OID_SIZE].hex()
+        offset += _OID_SIZE
+
+    return index
+
+
+def _write_index(index: Dict[str, str]) -> bytes:
+    out = bytearray(INDEX_MAGIC)
+    for path, oid in index.items():
+        path_bytes = os.fsencode(path)
+        out += _INDEX_PATH_LEN.pack(len(path_bytes))
+        out += path_bytes
+        out += bytes.fromhex(oid)
+
+    return bytes(out)
+
         
 def hash_object(data: bytes, type_: str = 'blob') -> str:
-    obj = type_.encode() + b'\x00' + data
-    oid = hashlib.sha1(obj).hexdigest()
-    path = f'{GIT_DIR}/objects/{oid}'
+    header = type_.encode() + b'\x00'
 
-    with open(path, 'wb') as out:
-        out.write(obj)
+    # Hash the uncompressed object, like git, without building header + data
+    sha = hashlib.sha1(header)
+    sha.update(data)
+    oid = sha.hexdigest()
 
+    compressor = zlib.compressobj(COMPRESSION_LEVEL)
+    _write_object(oid, (compressor.compress(header), compressor.compress(data),
+                        compressor.flush()))
+
+    if len(header) + len(data) <= OBJECT_CACHE_MAX_SIZE:
+        _cache_object(oid, header + data)
     return oid
 
 
-def get_object(oid: str, expected: Optional[str] = 'blob') -> bytes:
-    path = f'{GIT_DIR}/objects/{oid}'
+# Like hash_object, but streams the file in chunks so its content is never
+# held in memory as a single bytes object
+def hash_file(path: str, type_: str = 'blob') -> str:
+    header = type_.encode() + b'\x00'
+    sha = hashlib.sha1(header)
+    compressor = zlib.compressobj(COMPRESSION_LEVEL)
+    compressed = [compressor.compress(header)]
 
     with open(path, 'rb') as f:
-        obj = f.read()
+        for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b''):
+            sha.update(chunk)
+            compressed.append(compressor.compress(chunk))
+
+    compressed.append(compressor.flush())
+    oid = sha.hexdigest()
+    _write_object(oid, compressed)
+    return oid
+
+
+def _write_object(oid: str, compressed: Sequence[bytes]) -> None:
+    if object_exists(oid):
+        return  # Never store the same object twice, loose or packed
+
+    if _pack_writer is not None:
+        _append_to_pack(_pack_writer, oid, compressed)
+    else:
+        _write_loose_object(_object_path(oid), compressed)
+
+
+def _write_loose_object(path: str, compressed: Sequence[bytes]) -> None:
+    _write_atomically(path, lambda out: out.writelines(compressed))
+
+
+# Objects only ever appear under their final name fully written: a crash
+# mid-write must not leave a truncated object that later reads trust.
+# On Linux the data goes to an anonymous O_TMPFILE inode that is linked into
+# place once complete; elsewhere a temporary file is renamed over the path.
+# write(out) fills the binary file out and may be called more than once.
+def _write_atomically(path: str, write: Callable[[BinaryIO], None]) -> None:
+    _make_object_dir(path)
+
+    global _use_tmpfile
+    if _use_tmpfile:
+        if _link_tmpfile(path, write):
+            return
+        _use_tmpfile = False  # Don't retry for every object
+
+    tmp_path = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+    flags = os.O_WRONLY | os.O_CREAT | os.O_TRUNC | getattr(os, 'O_BINARY', 0)
+    try:
+        with open(os.open(tmp_path, flags, OBJECT_FILE_MODE), 'wb') as out:
+            write(out)
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.remove(tmp_path)
+        except FileNotFoundError:
+            pass
+        raise
+
+
+_use_tmpfile = hasattr(os, 'O_TMPFILE')
+
+# Objects never change once written, so both write paths make them read-only
+OBJECT_FILE_MODE = 0o444
+
+
+# Returns False if the filesystem (or /proc) can't do O_TMPFILE + link
+def _link_tmpfile(path: str, write: Callable[[BinaryIO], None]) -> bool:
+    try:
+        fd = os.open(os.path.dirname(path), os.O_TMPFILE | os.O_WRONLY, OBJECT_FILE_MODE)
+    except OSError:
+        return False
+
+    with open(fd, 'wb') as out:
+        write(out)
+        out.flush()
+        try:
+            os.link(f'/proc/self/fd/{fd}', path)
+        except FileExistsError:
+            pass  # Same oid, same content
+        except OSError:
+            return False
+
+    return True
+
+
+def get_object(oid: str, expected: Optional[str] = 'blob') -> bytes:
+    obj = _object_cache.get(oid)
+
+    if obj is None:
+        try:
+            obj = _read_loose_object(oid)
+        except FileNotFoundError:
+            obj = _read_packed_object(oid)
+            if obj is None:
+                raise
+        else:
+            try:
+                obj = zlib.decompress(obj)
+            except zlib.error:
+                # Written before objects were compressed; anything else is corrupt
+                if not obj.startswith(_LEGACY_OBJECT_HEADERS):
+                    raise
+        _cache_object(oid, obj)
 
     type_, _, content = obj.partition(b'\x00')
     type_str = type_.decode()
@@ -118,26 +308,334 @@ def get_object(oid: str, expected: Optional[str] = 'blob') -> bytes:
     return content
 
 
+_LEGACY_OBJECT_HEADERS = (b'blob\x00', b'tree\x00', b'commit\x00')
+
+
+# Reads a loose object file, falling back to the flat objects/<oid> path of a
+# repository that was never migrated (a remote is read, not migrated)
+def _read_loose_object(oid: str, git_dir: Optional[str] = None) -> bytes:
+    try:
+        with open(_object_path(oid, git_dir), 'rb') as f:
+            return f.read()
+    except FileNotFoundError:
+        with open(_legacy_object_path(oid, git_dir), 'rb') as f:
+            return f.read()
+
+
+# Decompressed objects by oid; oids name their content, so entries never go stale
+_object_cache: Dict[str, bytes] = {}
+
+
+def _cache_object(oid: str, obj: bytes) -> None:
+    if len(obj) > OBJECT_CACHE_MAX_SIZE:
+        return  # Large blobs would crowd out the trees and commits worth caching
+
+    _object_cache.pop(oid, None)
+    if len(_object_cache) >= OBJECT_CACHE_SIZE:
+        del _object_cache[next(iter(_object_cache))]  # Evict least recently stored
+    _object_cache[oid] = obj
+
+
+# Packed objects are found through the in-memory idx, without opening the pack
 def object_exists(oid: str) -> bool:
-    return os.path.exists(f'{GIT_DIR}/objects/{oid}')
+    if os.path.exists(_object_path(oid)):
+        return True
+
+    raw_oid = bytes.fromhex(oid)
+    return any(_find_in_pack_idx(idx, raw_oid) is not None for _, idx in _load_packs())
 
 
 def fetch_object_if_missing(oid: str, remote_git_dir: str) -> None:
     if object_exists(oid):
         return
 
+    fetch_object(oid, remote_git_dir)
+
+
+def fetch_object(oid: str, remote_git_dir: str) -> None:
     remote_git_dir += '/.ugit'
 
-    shutil.copy(
-        f'{remote_git_dir}/objects/{oid}',
-        f'{GIT_DIR}/objects/{oid}'
-    )
+    _transfer_object(oid, remote_git_dir, GIT_DIR)  # type: ignore
 
 
 def push_object(oid: str, remote_git_dir: str) -> None:
     remote_git_dir += '/.ugit'
 
-    shutil.copy(
-        f'{GIT_DIR}/objects/{oid}',
-        f'{remote_git_dir}/objects/{oid}'
-    )
+    _transfer_object(oid, GIT_DIR, remote_git_dir)  # type: ignore
+
+
+# Copies one object between repositories; packed objects arrive as loose ones
+def _transfer_object(oid: str, src_git_dir: str, dst_git_dir: str) -> None:
+    path = _object_path(oid, dst_git_dir)
+
+    try:
+        try:
+            _copy_object(_object_path(oid, src_git_dir), path)
+        except FileNotFoundError:
+            _copy_object(_legacy_object_path(oid, src_git_dir), path)
+    except FileNotFoundError:
+        payload = _read_packed_object(oid, src_git_dir, decompress=False)
+        if payload is None:
+            raise
+        _write_loose_object(path, (payload,))
+
+
+# Lists every object oid, loose or packed, with one directory read per shard
+# instead of a stat per oid through object_exists
+def iter_object_oids(git_dir: Optional[str] = None) -> Iterator[str]:
+    try:
+        shards = list(os.scandir(f'{git_dir or GIT_DIR}/objects'))
+    except FileNotFoundError:
+        return
+
+    for shard in shards:
+        if len(shard.name) == 2 and shard.is_dir():
+            yield from (shard.name + entry.name for entry in os.scandir(shard.path)
+                        if len(entry.name) == 38)  # Skip leftover temporary files
+        elif len(shard.name) == 40 and shard.is_file():
+            yield shard.name  # Flat object of an unmigrated repository
+
+    for _, idx in _load_packs(git_dir):
+        for raw_oid, _ in _iter_pack_idx(idx):
+            yield raw_oid.hex()
+
+
+# Copies an object file kernel-side with sendfile where the platform allows,
+# through the same atomic write as new objects
+def _copy_object(src: str, dst: str) -> None:
+    with open(src, 'rb') as s:
+        _write_atomically(dst, lambda d: _sendfile(s, d))
+
+
+def _sendfile(s: BinaryIO, d: BinaryIO) -> None:
+    size = os.fstat(s.fileno()).st_size
+    try:
+        offset = 0
+        while offset < size:
+            sent = os.sendfile(d.fileno(), s.fileno(), offset, size - offset)
+            if not sent:
+                break
+            offset += sent
+    except (AttributeError, OSError):
+        # No sendfile, or it only supports sockets here (e.g. macOS)
+        s.seek(0)
+        d.seek(0)
+        d.truncate()
+        shutil.copyfileobj(s, d)
+
+
+# Objects are fanned out like git: objects/<first 2 hex>/<remaining 38 hex>
+def _object_path(oid: str, git_dir: Optional[str] = None) -> str:
+    return f'{git_dir or GIT_DIR}/objects/{oid[:2]}/{oid[2:]}'
+
+
+def _legacy_object_path(oid: str, git_dir: Optional[str] = None) -> str:
+    return f'{git_dir or GIT_DIR}/objects/{oid}'
+
+
+# Shard directories already known to exist, so makedirs runs once per shard
+_object_dirs: Set[str] = set()
+
+
+def _make_object_dir(path: str) -> None:
+    dirname = os.path.dirname(path)
+    if dirname not in _object_dirs:
+        os.makedirs(dirname, exist_ok=True)
+        _object_dirs.add(dirname)
+
+
+# Present in objects/ once the repository uses shards, so migrate_objects costs
+# one stat instead of a directory scan on every command
+OBJECTS_SHARDED_MARKER = 'sharded'
+
+
+# Moves objects stored flat as objects/<oid> (older repositories) into their shard
+def migrate_objects(git_dir: Optional[str] = None) -> None:
+    objects_dir = f'{git_dir or GIT_DIR}/objects'
+    marker = f'{objects_dir}/{OBJECTS_SHARDED_MARKER}'
+    if os.path.exists(marker) or not os.path.isdir(objects_dir):
+        return
+
+    for entry in os.scandir(objects_dir):
+        if len(entry.name) == 40 and entry.is_file():
+            path = _object_path(entry.name, git_dir)
+            _make_object_dir(path)
+            os.rename(entry.path, path)
+
+    open(marker, 'w').close()
+
+
+# Pack files hold many objects in one file, so a bulk write (like add) costs
+# one file instead of one file and directory entry per object.
+#
+# objects/pack/pack-<id>.pack is a series of records: a <20sI header with the
+# raw oid and the payload length, then the zlib-compressed object (the same
+# bytes a loose object file holds). pack-<id>.idx is PACK_IDX_MAGIC followed
+# by <20sQ (raw oid, record offset) entries sorted by oid for binary search.
+PACK_IDX_MAGIC = b'UGPI'
+_PACK_RECORD_HEADER = struct.Struct('<20sI')
+_PACK_IDX_ENTRY = struct.Struct('<20sQ')
+
+# Fewer new objects than this are written loose; a pack isn't worth it
+PACK_MIN_OBJECTS = 100
+
+# Once there would be more packs than this, the new pack absorbs the old ones
+MAX_PACKS = 8
+
+_PackWriter = namedtuple('_PackWriter', ['file', 'offsets', 'lock'])
+
+# Set while a begin_pack() block is active; new objects go into its pack
+_pack_writer: Optional[_PackWriter] = None
+
+
+# Collects the objects written inside the block into one pack. count is how
+# many objects the caller expects to write; below PACK_MIN_OBJECTS nothing is
+# packed. If fewer new objects than that turn up, they are written loose.
+@contextmanager
+def begin_pack(count: Optional[int] = None):
+    global _pack_writer
+
+    if _pack_writer is not None or (count is not None and count < PACK_MIN_OBJECTS):
+        yield  # Already packing, or too few objects to bother
+        return
+
+    pack_dir = f'{GIT_DIR}/objects/pack'
+    os.makedirs(pack_dir, exist_ok=True)
+    tmp_path = f'{pack_dir}/tmp-{os.getpid()}'
+
+    pack_file = open(f'{tmp_path}.pack', 'w+b')
+    _pack_writer = writer = _PackWriter(pack_file, {}, threading.Lock())
+    try:
+        yield
+        _pack_writer = None
+        _finish_pack(writer, tmp_path)
+    finally:
+        _pack_writer = None
+        pack_file.close()
+        # Still there if the block failed or the objects were written loose
+        if os.path.exists(f'{tmp_path}.pack'):
+            os.remove(f'{tmp_path}.pack')
+
+
+def _append_to_pack(writer: _PackWriter, oid: str, compressed: Sequence[bytes]) -> None:
+    raw_oid = bytes.fromhex(oid)
+    payload = b''.join(compressed)
+
+    with writer.lock:
+        if raw_oid in writer.offsets:
+            return
+        _write_pack_record(writer, raw_oid, payload)
+
+
+def _write_pack_record(writer: _PackWriter, raw_oid: bytes, payload: bytes) -> None:
+    writer.offsets[raw_oid] = writer.file.tell()
+    writer.file.write(_PACK_RECORD_HEADER.pack(raw_oid, len(payload)))
+    writer.file.write(payload)
+
+
+def _read_pack_record(pack_file: BinaryIO, offset: int) -> bytes:
+    pack_file.seek(offset)
+    _, size = _PACK_RECORD_HEADER.unpack(pack_file.read(_PACK_RECORD_HEADER.size))
+    return pack_file.read(size)
+
+
+def _finish_pack(writer: _PackWriter, tmp_path: str) -> None:
+    if len(writer.offsets) < PACK_MIN_OBJECTS:
+        for raw_oid, offset in writer.offsets.items():
+            payload = _read_pack_record(writer.file, offset)
+            _write_loose_object(_object_path(raw_oid.hex()), (payload,))
+        return
+
+    # Cap the number of packs (each miss checks all of them) by copying every
+    # existing pack into this one
+    old_packs = _load_packs()
+    if len(old_packs) < MAX_PACKS:
+        old_packs = []
+    for pack_path, idx in old_packs:
+        with open(pack_path, 'rb') as old_file:
+            for raw_oid, offset in _iter_pack_idx(idx):
+                if raw_oid not in writer.offsets:
+                    payload = _read_pack_record(old_file, offset)
+                    writer.file.seek(0, os.SEEK_END)
+                    _write_pack_record(writer, raw_oid, payload)
+    writer.file.flush()
+
+    idx = bytearray(PACK_IDX_MAGIC)
+    for raw_oid, offset in sorted(writer.offsets.items()):
+        idx += _PACK_IDX_ENTRY.pack(raw_oid, offset)
+
+    # The .idx appears last, so readers never see a pack without its data
+    name = f'{os.path.dirname(tmp_path)}/pack-{hashlib.sha1(idx).hexdigest()}'
+    os.replace(f'{tmp_path}.pack', f'{name}.pack')
+    with open(f'{tmp_path}.idx', 'wb') as f:
+        f.write(idx)
+    os.replace(f'{tmp_path}.idx', f'{name}.idx')
+
+    # Remove each merged pack's idx before its data, so no reader finds an idx
+    # without its pack
+    for pack_path, _ in old_packs:
+        os.remove(f'{pack_path[:-5]}.idx')
+        os.remove(pack_path)
+
+    _packs.pop(GIT_DIR, None)  # type: ignore
+
+
+# (pack path, idx contents) of every complete pack, per git dir, read on first
+# use. The idx files are small; pack files are only opened to read an object.
+_packs: Dict[str, List[Tuple[str, bytes]]] = {}
+
+
+def _load_packs(git_dir: Optional[str] = None) -> List[Tuple[str, bytes]]:
+    git_dir = git_dir or GIT_DIR
+    packs = _packs.get(git_dir)  # type: ignore
+    if packs is None:
+        packs = []
+        try:
+            entries = list(os.scandir(f'{git_dir}/objects/pack'))
+        except FileNotFoundError:
+            entries = []
+
+        for entry in entries:
+            if entry.name.startswith('pack-') and entry.name.endswith('.idx'):
+                with open(entry.path, 'rb') as f:
+                    packs.append((f'{entry.path[:-4]}.pack', f.read()))
+        _packs[git_dir] = packs  # type: ignore
+
+    return packs
+
+
+def _iter_pack_idx(idx: bytes) -> Iterator[Tuple[bytes, int]]:
+    return _PACK_IDX_ENTRY.iter_unpack(memoryview(idx)[len(PACK_IDX_MAGIC):])
+
+
+# Returns the object from a pack (decompressed, or as stored), or None
+def _read_packed_object(oid: str, git_dir: Optional[str] = None,
+                        decompress: bool = True) -> Optional[bytes]:
+    raw_oid = bytes.fromhex(oid)
+
+    for pack_path, idx in _load_packs(git_dir):
+        offset = _find_in_pack_idx(idx, raw_oid)
+        if offset is None:
+            continue
+
+        with open(pack_path, 'rb') as pack_file:
+            payload = _read_pack_record(pack_file, offset)
+        return zlib.decompress(payload) if decompress else payload
+
+    return None
+
+
+def _find_in_pack_idx(idx: bytes, raw_oid: bytes) -> Optional[int]:
+    lo, hi = 0, (len(idx) - len(PACK_IDX_MAGIC)) // _PACK_IDX_ENTRY.size
+    while lo < hi:
+        mid = (lo + hi) // 2
+        pos = len(PACK_IDX_MAGIC) + mid * _PACK_IDX_ENTRY.size
+        key = idx[pos:pos + _OID_SIZE]
+        if key < raw_oid:
+            lo = mid + 1
+        elif key > raw_oid:
+            hi = mid
+        else:
+            return _PACK_IDX_ENTRY.unpack_from(idx, pos)[1]
+
+    return None
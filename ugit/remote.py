@@ -1,4 +1,5 @@
 import os
+from concurrent.futures import ThreadPoolExecutor
 from . import data
 from . import base
 
@@ -10,8 +11,23 @@ def fetch (remote_path):
 
     refs = _get_remote_refs(remote_path, REMOTE_REFS_BASE)
     
-    for oid in base.iter_objects_in_commits(refs.values):
-        data.fetch_object_if_missing(oid,remote_path)
+    # One listing of our objects instead of a stat per oid
+    local_objects = set(data.iter_object_oids())
+
+    # Only commits our refs point to are known to have their whole history
+    # here; any other local commit may be left over from an interrupted fetch
+    local_refs = {ref.value for _, ref in data.iter_refs()}
+
+    # Walk the remote's history in the remote repository itself, so the list of
+    # missing objects is known up front; commits under our refs end the walk
+    with data.change_git_dir(remote_path):
+        missing = [oid for oid in base.iter_objects_in_commits(
+                       refs.values(), stop_at=local_refs)
+                   if oid not in local_objects]
+
+    # Each copy is an independent pair of files, so overlap them
+    with ThreadPoolExecutor() as executor:
+        list(executor.map(lambda oid: data.fetch_object(oid, remote_path), missing))
     
     for remote_name, value in refs.items():
         refname = os.path.relpath(remote_name,REMOTE_REFS_BASE)
@@ -36,17 +52,16 @@ def push (remote_path, refname):
     assert local_ref
     
     
-    assert not remote_refs or base.is_ancestor_of(local_ref, remote_refs)
+    assert not remote_ref or base.is_ancestor_of(local_ref, remote_ref)
     # Compute which objects the server doesn't have
     
-    # Filter remote refs to only those whose objects already exist locally
-    known_remote_refs = filter(data.object_exists, remote_refs.values())
-
-    # Get all reachable objects (commits, trees, blobs) from the filtered remote refs
-    remote_objects = set(base.iter_objects_in_commits(known_remote_refs))
+    # List the objects the remote already has, one directory read per shard
+    remote_objects = set(data.iter_object_oids(f'{remote_path}/.ugit'))
 
-    # Get all reachable objects from the local ref (e.g., local branch)
-    local_objects = set(base.iter_objects_in_commits({local_ref}))
+    # Get the objects reachable from the local ref (e.g., local branch), without
+    # walking history past the commits the remote refs already point at
+    local_objects = set(base.iter_objects_in_commits(
+        {local_ref}, stop_at=set(remote_refs.values())))
 
     # Determine which objects exist locally but not in the remote — these need to be pushed
     objects_to_push = local_objects - remote_objects